@@ -77,6 +77,7 @@ def hide_fields_in_newer_versions(obj):
 
 class AuditTemplatePostType(wtypes.Base):
     _ctx = context_utils.make_context()
+    _scope_validator = None
 
     name = wtypes.wsattr(wtypes.text, mandatory=True)
     """Name of this audit template"""
@@ -104,6 +105,16 @@ class AuditTemplatePostType(wtypes.Base):
             scope=self.scope,
         )
 
+    @staticmethod
+    def _get_scope_validator():
+        # NOTE: the available collectors cannot change at runtime, so the
+        # scope validator is only built once and then reused.
+        if AuditTemplatePostType._scope_validator is None:
+            AuditTemplatePostType._scope_validator = (
+                common_utils.Draft4Validator(
+                    AuditTemplatePostType._build_schema()))
+        return AuditTemplatePostType._scope_validator
+
     @staticmethod
     def _build_schema():
         SCHEMA = {
@@ -141,9 +152,8 @@ class AuditTemplatePostType(wtypes.Base):
             keys = [list(s)[0] for s in audit_template.scope]
             if keys[0] not in ('compute', 'storage'):
                 audit_template.scope = [dict(compute=audit_template.scope)]
-            common_utils.Draft4Validator(
-                AuditTemplatePostType._build_schema()
-                ).validate(audit_template.scope)
+            AuditTemplatePostType._get_scope_validator().validate(
+                audit_template.scope)
 
             include_host_aggregates = False
             exclude_host_aggregates = False
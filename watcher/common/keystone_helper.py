@@ -12,6 +12,7 @@
 # limitations under the License.
 #
 
+import futurist
 from oslo_log import log
 
 from keystoneauth1.exceptions import http as ks_exceptions
@@ -32,64 +33,52 @@ class KeystoneHelper(object):
         """:param osc: an OpenStackClients instance"""
         self.osc = osc if osc else clients.OpenStackClients()
         self.keystone = self.osc.keystone()
+        self._cache = {'role': {}, 'user': {}, 'project': {}, 'domain': {}}
 
-    def get_role(self, name_or_id):
+    def _get_resource(self, kind, manager, name_or_id, not_found_msg,
+                      ambiguous_msg):
+        cached = self._cache[kind].get(name_or_id)
+        if cached is not None:
+            return cached
         try:
-            role = self.keystone.roles.get(name_or_id)
-            return role
+            resource = manager.get(name_or_id)
         except ks_exceptions.NotFound:
-            roles = self.keystone.roles.list(name=name_or_id)
-            if len(roles) == 0:
-                raise exception.Invalid(
-                    message=(_("Role not Found: %s") % name_or_id))
-            if len(roles) > 1:
-                raise exception.Invalid(
-                    message=(_("Role name seems ambiguous: %s") % name_or_id))
-        return roles[0]
+            resources = manager.list(name=name_or_id)
+            if len(resources) == 0:
+                raise exception.Invalid(message=(not_found_msg % name_or_id))
+            if len(resources) > 1:
+                raise exception.Invalid(message=(ambiguous_msg % name_or_id))
+            resource = resources[0]
+        # NOTE: names are only unique within a domain, so a resource is
+        # cached under its id and under the key it was looked up with, but
+        # never under a name it was not explicitly resolved from.
+        self._cache[kind][name_or_id] = resource
+        self._cache[kind][resource.id] = resource
+        return resource
+
+    def clear_cache(self):
+        for resources in self._cache.values():
+            resources.clear()
+
+    def get_role(self, name_or_id):
+        return self._get_resource(
+            'role', self.keystone.roles, name_or_id,
+            _("Role not Found: %s"), _("Role name seems ambiguous: %s"))
 
     def get_user(self, name_or_id):
-        try:
-            user = self.keystone.users.get(name_or_id)
-            return user
-        except ks_exceptions.NotFound:
-            users = self.keystone.users.list(name=name_or_id)
-            if len(users) == 0:
-                raise exception.Invalid(
-                    message=(_("User not Found: %s") % name_or_id))
-            if len(users) > 1:
-                raise exception.Invalid(
-                    message=(_("User name seems ambiguous: %s") % name_or_id))
-            return users[0]
+        return self._get_resource(
+            'user', self.keystone.users, name_or_id,
+            _("User not Found: %s"), _("User name seems ambiguous: %s"))
 
     def get_project(self, name_or_id):
-        try:
-            project = self.keystone.projects.get(name_or_id)
-            return project
-        except ks_exceptions.NotFound:
-            projects = self.keystone.projects.list(name=name_or_id)
-            if len(projects) == 0:
-                raise exception.Invalid(
-                    message=(_("Project not Found: %s") % name_or_id))
-            if len(projects) > 1:
-                raise exception.Invalid(
-                    message=(_("Project name seems ambiguous: %s") %
-                             name_or_id))
-            return projects[0]
+        return self._get_resource(
+            'project', self.keystone.projects, name_or_id,
+            _("Project not Found: %s"), _("Project name seems ambiguous: %s"))
 
     def get_domain(self, name_or_id):
-        try:
-            domain = self.keystone.domains.get(name_or_id)
-            return domain
-        except ks_exceptions.NotFound:
-            domains = self.keystone.domains.list(name=name_or_id)
-            if len(domains) == 0:
-                raise exception.Invalid(
-                    message=(_("Domain not Found: %s") % name_or_id))
-            if len(domains) > 1:
-                raise exception.Invalid(
-                    message=(_("Domain name seems ambiguous: %s") %
-                             name_or_id))
-            return domains[0]
+        return self._get_resource(
+            'domain', self.keystone.domains, name_or_id,
+            _("Domain not Found: %s"), _("Domain name seems ambiguous: %s"))
 
     def create_session(self, user_id, password):
         user = self.get_user(user_id)
@@ -102,18 +91,31 @@ class KeystoneHelper(object):
         return session.Session(auth=auth)
 
     def create_user(self, user):
-        project = self.get_project(user['project'])
-        domain = self.get_domain(user['domain'])
-        _user = self.keystone.users.create(
-            user['name'],
-            password=user['password'],
-            domain=domain,
-            project=project,
-        )
-        for role in user['roles']:
-            role = self.get_role(role)
-            self.keystone.roles.grant(
-                role.id, user=_user.id, project=project.id)
+        # NOTE: the project, the domain and the roles are independent of each
+        # other, resolve them concurrently rather than one round-trip at a
+        # time, and do the same for the role assignments of the new user.
+        role_names = list(dict.fromkeys(user['roles']))
+        with futurist.GreenThreadPoolExecutor(
+                max_workers=len(role_names) + 2) as executor:
+            project = executor.submit(self.get_project, user['project'])
+            domain = executor.submit(self.get_domain, user['domain'])
+            roles = {name: executor.submit(self.get_role, name)
+                     for name in role_names}
+            project = project.result()
+            domain = domain.result()
+            roles = {name: role.result() for name, role in roles.items()}
+            _user = self.keystone.users.create(
+                user['name'],
+                password=user['password'],
+                domain=domain,
+                project=project,
+            )
+            grants = [
+                executor.submit(self.keystone.roles.grant, roles[name].id,
+                                user=_user.id, project=project.id)
+                for name in user['roles']]
+            for grant in grants:
+                grant.result()
         return _user
 
     def delete_user(self, user):
@@ -122,3 +124,5 @@ class KeystoneHelper(object):
             self.keystone.users.delete(user)
         except exception.Invalid:
             pass
+        finally:
+            self.clear_cache()
@@ -51,6 +51,27 @@ class NovaHelper(object):
                          node.hypervisor_type != 'ironic']
         return compute_nodes
 
+    def get_compute_node_detail_map(self, limit=1000):
+        """Get all the hypervisors (compute nodes) with their details
+
+        :param limit: maximum number of hypervisors to request per page, it
+            should not exceed the [api]max_limit of the compute API
+        :returns: dict of novaclient.v2.hypervisors.Hypervisor objects indexed
+            by their id, baremetal nodes included
+        """
+        # NOTE: the compute API only returns a single page of hypervisors,
+        # capped by its [api]max_limit (1000 by default), so page through the
+        # listing until a page shorter than the limit comes back.
+        compute_nodes = {}
+        marker = None
+        while True:
+            page = self.nova.hypervisors.list(detailed=True, marker=marker,
+                                              limit=limit)
+            compute_nodes.update((node.id, node) for node in page)
+            if len(page) < limit:
+                return compute_nodes
+            marker = page[-1].id
+
     def get_compute_node_by_name(self, node_name, servers=False,
                                  detailed=False):
         """Search for a hypervisor (compute node) by hypervisor_hostname
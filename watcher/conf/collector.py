@@ -41,7 +41,15 @@ Custom data model collector plugins can be defined with the
                     "calls."),
     cfg.IntOpt('api_query_timeout',
                default=1,
-               help="Time before retry after failed call to external service.")
+               help="Time before retry after failed call to external "
+                    "service."),
+    cfg.IntOpt('compute_metadata_cache_ttl',
+               default=30,
+               min=0,
+               help="Time (in seconds) during which the host aggregates and "
+                    "compute services retrieved from nova are reused when "
+                    "building the compute data model. Set to 0 to always "
+                    "retrieve them.")
 ]
 
 
@@ -13,7 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import itertools
+import logging
+import time
+
 import os_resource_classes as orc
+from oslo_config import cfg
 from oslo_log import log
 
 from futurist import waiters
@@ -27,8 +33,34 @@ from watcher.decision_engine.model.notification import nova
 from watcher.decision_engine.scope import compute as compute_scope
 from watcher.decision_engine import threading
 
+CONF = cfg.CONF
 LOG = log.getLogger(__name__)
 
+# Extended attributes of the Nova servers
+HOST_ATTR = "OS-EXT-SRV-ATTR:host"
+VM_STATE_ATTR = "OS-EXT-STS:vm_state"
+
+
+def _inline_refs(schema, ref_prefix, definitions):
+    """Replace the references of a schema by the sub-schemas they point to
+
+    :param schema: the schema holding the references
+    :param ref_prefix: prefix of the "$ref"s pointing to the definitions
+    :param definitions: mapping of the referenced sub-schemas
+    :return: a copy of the schema without any of these references
+    """
+    if isinstance(schema, dict):
+        ref = schema.get("$ref", "")
+        if ref.startswith(ref_prefix):
+            return _inline_refs(definitions[ref[len(ref_prefix):]],
+                                ref_prefix, definitions)
+        return {key: _inline_refs(value, ref_prefix, definitions)
+                for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_refs(value, ref_prefix, definitions)
+                for value in schema]
+    return schema
+
 
 class NovaClusterDataModelCollector(base.BaseClusterDataModelCollector):
     """Nova cluster data model collector
@@ -152,9 +184,14 @@ class NovaClusterDataModelCollector(base.BaseClusterDataModelCollector):
         },
         "additionalProperties": False
     }
+    # NOTE: the "$ref"s are rooted at the audit scope document, inlining them
+    # makes the SCHEMA self-contained and spares their resolution whenever a
+    # scope is validated.
+    SCHEMA = _inline_refs(SCHEMA, HOST_AGGREGATES, SCHEMA["host_aggregates"])
 
     def __init__(self, config, osc=None):
         super(NovaClusterDataModelCollector, self).__init__(config, osc)
+        self._notification_endpoints = None
 
     @property
     def notification_endpoints(self):
@@ -163,9 +200,11 @@ class NovaClusterDataModelCollector(base.BaseClusterDataModelCollector):
         :return: Associated notification endpoints
         :rtype: List of :py:class:`~.EventsNotificationEndpoint` instances
         """
-        return [
-            nova.VersionedNotification(self),
-        ]
+        if self._notification_endpoints is None:
+            self._notification_endpoints = [
+                nova.VersionedNotification(self),
+            ]
+        return self._notification_endpoints
 
     def get_audit_scope_handler(self, audit_scope):
         self._audit_scope_handler = compute_scope.ComputeScope(
@@ -211,6 +250,10 @@ class NovaModelBuilder(base.BaseModelBuilder):
     commented out.
     """
 
+    # Nova listings shared by all the model builders, indexed by the name of
+    # the nova_helper method which retrieved them.
+    _listing_cache = {}
+
     def __init__(self, osc):
         self.osc = osc
         self.model = None
@@ -221,68 +264,126 @@ class NovaModelBuilder(base.BaseModelBuilder):
         self.placement_helper = placement_helper.PlacementHelper(osc=self.osc)
         self.executor = threading.DecisionEngineThreadPool()
 
+    @classmethod
+    def _clear_listing_cache(cls):
+        """Forget the nova listings shared by all the model builders"""
+        cls._listing_cache.clear()
+
+    def _get_cached_listing(self, method_name):
+        """Retrieve a nova listing, reusing it until it expires
+
+        :param method_name: name of the nova_helper method to call
+        :return: the listing as returned by the nova_helper method
+        """
+        ttl = CONF.collector.compute_metadata_cache_ttl
+        cached = self._listing_cache.get(method_name)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
+        listing = self.call_retry(f=getattr(self.nova_helper, method_name))
+        self._listing_cache[method_name] = (time.monotonic(), listing)
+        return listing
+
     def _collect_aggregates(self, host_aggregates, _nodes):
         if not host_aggregates:
             return
 
-        aggregate_list = self.call_retry(f=self.nova_helper.get_aggregate_list)
-        aggregate_ids = [aggregate['id'] for aggregate
-                         in host_aggregates if 'id' in aggregate]
-        aggregate_names = [aggregate['name'] for aggregate
-                           in host_aggregates if 'name' in aggregate]
-        include_all_nodes = any('*' in field
-                                for field in (aggregate_ids, aggregate_names))
+        aggregate_list = self._get_cached_listing('get_aggregate_list')
+        aggregate_ids = set()
+        aggregate_names = set()
+        for aggregate in host_aggregates:
+            if 'id' in aggregate:
+                aggregate_ids.add(aggregate['id'])
+            if 'name' in aggregate:
+                aggregate_names.add(aggregate['name'])
+        include_all_nodes = '*' in aggregate_ids or '*' in aggregate_names
+
+        if include_all_nodes:
+            _nodes.update(itertools.chain.from_iterable(
+                aggregate.hosts for aggregate in aggregate_list))
+            return
 
         for aggregate in aggregate_list:
             if (aggregate.id in aggregate_ids or
-                aggregate.name in aggregate_names or
-                    include_all_nodes):
+                    aggregate.name in aggregate_names):
                 _nodes.update(aggregate.hosts)
 
     def _collect_zones(self, availability_zones, _nodes):
         if not availability_zones:
             return
 
-        service_list = self.call_retry(f=self.nova_helper.get_service_list)
-        zone_names = [zone['name'] for zone
-                      in availability_zones]
-        include_all_nodes = False
+        service_list = self._get_cached_listing('get_service_list')
+        zone_names = {zone['name'] for zone
+                      in availability_zones}
+
         if '*' in zone_names:
-            include_all_nodes = True
+            _nodes.update(service.host for service in service_list)
+            return
+
         for service in service_list:
-            if service.zone in zone_names or include_all_nodes:
+            if service.zone in zone_names:
                 _nodes.add(service.host)
 
-    def _compute_node_future(self, future, future_instances):
-        """Add compute node information to model and schedule instance info job
+    def _get_compute_node(self, node_info):
+        """Retrieve the placement inventories of a compute node
+
+        Executed in the DecisionEngineThreadPool so that the Placement
+        requests of the different compute nodes overlap.
+
+        :param node_info: the detailed node hypervisor
+        :return: tuple of the node hypervisor and its inventories, the
+                 inventories are None for baremetal nodes
+        """
+        if node_info.hypervisor_type == 'ironic':
+            return node_info, None
+        inventories = self.placement_helper.get_inventories(node_info.id)
+        return node_info, inventories or {}
+
+    def _get_instances(self, node_info):
+        """Retrieve the instances hosted by a compute node
+
+        Executed in the DecisionEngineThreadPool so that the Nova requests of
+        the different compute nodes overlap.
+
+        :param node_info: the detailed node hypervisor
+        :return: list of the Nova servers hosted by the compute node
+        """
+        # running_vms is only reported up to microversion 2.87
+        running_vms = getattr(node_info, "running_vms", None)
+        if running_vms == 0:
+            return []
+        limit = (running_vms if running_vms is not None and
+                 running_vms <= 1000 else -1)
+        # Get all servers on this compute host.
+        # Note that the advantage of passing the limit parameter is
+        # that it can speed up the call time of novaclient. 1000 is
+        # the default maximum number of return servers provided by
+        # compute API. If we need to request more than 1000 servers,
+        # we can set limit=-1. For details, please see:
+        # https://bugs.launchpad.net/watcher/+bug/1834679
+        return self.call_retry(f=self.nova_helper.get_instance_list,
+                               filters={'host': node_info.service["host"]},
+                               limit=limit)
+
+    def _compute_node_future(self, future, added_nodes):
+        """Add compute node information to model
 
         :param future: The future from the finished execution
         :rtype future: :py:class:`futurist.GreenFuture`
-        :param future_instances: list of futures for instance jobs
-        :rtype future_instances:  list :py:class:`futurist.GreenFuture`
+        :param added_nodes: list of the compute nodes added to the model
+        :rtype added_nodes: list :py:class:`~.ComputeNode`
         """
         try:
-            node_info = future.result()[0]
+            node_info, inventories = future.result()
 
             # filter out baremetal node
             if node_info.hypervisor_type == 'ironic':
                 LOG.debug("filtering out baremetal node: %s", node_info)
                 return
-            self.add_compute_node(node_info)
-            # node.servers is a list of server objects
-            # New in nova version 2.53
-            instances = getattr(node_info, "servers", None)
-            # Do not submit job if there are no instances on compute node
-            if instances is None:
-                LOG.info("No instances on compute_node: %s", node_info)
-                return
-            future_instances.append(
-                self.executor.submit(
-                    self.add_instance_node, node_info, instances)
-            )
+            added_nodes.append(
+                self.add_compute_node(node_info, inventories))
         except Exception:
-            LOG.error("compute node from aggregate / "
-                      "availability_zone could not be found")
+            LOG.error("compute node could not be added to the model")
 
     def _add_physical_layer(self):
         """Collects all information on compute nodes and instances
@@ -292,13 +393,23 @@ class NovaModelBuilder(base.BaseModelBuilder):
         do not specify any compute nodes all nodes are retrieved instead.
 
         The collection of information happens concurrently using the
-        DecisionEngineThreadpool. The collection is parallelized in three steps
+        DecisionEngineThreadpool. The collection is parallelized in two steps
         first information about aggregates and zones is gathered. Secondly,
-        for each of the compute nodes a tasks is submitted to get detailed
-        information about the compute node. Finally, Each of these submitted
-        tasks will submit an additional task if the compute node contains
-        instances. Before returning from this function all instance tasks are
-        waited upon to complete.
+        the details of all the hypervisors are retrieved at once and for each
+        of the compute nodes a task is submitted to get its placement
+        inventories. Finally, the instances are added to the compute nodes
+        hosting them.
+
+        When the whole cloud is in scope all the instances are retrieved with
+        a single listing. Otherwise a task is submitted for each compute node
+        to list the instances of its host, which avoids downloading every
+        server of the cloud for an audit scoped to a few hosts.
+
+        Only the requests to Nova and Placement are executed by the
+        threadpool, the model itself is always updated from the calling thread
+        as each of the tasks completes. A compute node or instance listing that
+        fails is logged and left out of the model, the rest of the model is
+        still built.
         """
 
         compute_nodes = set()
@@ -317,33 +428,82 @@ class NovaModelBuilder(base.BaseModelBuilder):
         }
         waiters.wait_for_all(zone_aggregate_futures)
 
+        # Retrieve the details of every hypervisor with a single listing
+        # rather than searching each of the compute nodes.
+        hypervisors = self.call_retry(
+            f=self.nova_helper.get_compute_node_detail_map).values()
         # if zones and aggregates did not contain any nodes get every node.
         if not compute_nodes:
             self.no_model_scope_flag = True
-            all_nodes = self.call_retry(
-                f=self.nova_helper.get_compute_node_list)
-            compute_nodes = set(
-                [node.hypervisor_hostname for node in all_nodes])
-        LOG.debug("compute nodes: %s", compute_nodes)
-
-        node_futures = [self.executor.submit(
-            self.nova_helper.get_compute_node_by_name,
-            node, servers=True, detailed=True)
-            for node in compute_nodes]
-        LOG.debug("submitted %d jobs", len(compute_nodes))
-
-        # Futures will concurrently be added, only safe with CPython GIL
-        future_instances = []
+            compute_nodes = {node.service["host"] for node in hypervisors}
+        else:
+            hypervisors = [node for node in hypervisors
+                           if node.service["host"] in compute_nodes]
+            missing_nodes = compute_nodes.difference(
+                node.service["host"] for node in hypervisors)
+            if missing_nodes:
+                LOG.error("compute nodes %s from aggregate / "
+                          "availability_zone could not be found",
+                          missing_nodes)
+        # Formatting the names of a large cluster is not free, only do it
+        # when the message is actually emitted.
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("%d compute nodes: %s", len(compute_nodes),
+                      sorted(compute_nodes))
+
+        node_futures = [self.executor.submit(self._get_compute_node, node)
+                        for node in hypervisors]
+        LOG.debug("submitted %d jobs", len(node_futures))
+
+        added_nodes = []
         self.executor.do_while_futures_modify(
-            node_futures, self._compute_node_future, future_instances)
+            node_futures, self._compute_node_future, added_nodes)
+        if not added_nodes:
+            return
 
-        # Wait for all instance jobs to finish
-        waiters.wait_for_all(future_instances)
+        if self.no_model_scope_flag:
+            # Every compute node is in the model, retrieve all the instances
+            # with a single listing rather than one request per compute node
+            # and dispatch them to their host.
+            try:
+                instances = self.call_retry(
+                    f=self.nova_helper.get_instance_list)
+            except Exception:
+                LOG.error("instances could not be added to the model")
+                return
+            instances_by_host = collections.defaultdict(list)
+            for inst in instances:
+                instances_by_host[getattr(inst, HOST_ATTR)].append(inst)
+            for compute_node in added_nodes:
+                self.add_instance_node(
+                    compute_node, instances_by_host.get(compute_node.hostname))
+            return
 
-    def add_compute_node(self, node):
+        # Only a part of the cloud is in scope, listing all of its instances
+        # would mostly download servers that are thrown away, so they are
+        # listed per compute node instead.
+        hypervisors_by_host = {node.service["host"]: node
+                               for node in hypervisors}
+        instance_futures = {
+            self.executor.submit(
+                self._get_instances,
+                hypervisors_by_host[compute_node.hostname]): compute_node
+            for compute_node in added_nodes}
+        waiters.wait_for_all(instance_futures)
+        for future, compute_node in instance_futures.items():
+            try:
+                instances = future.result()
+            except Exception:
+                LOG.error("instances of compute node %s could not be added "
+                          "to the model", compute_node.hostname)
+                continue
+            self.add_instance_node(compute_node, instances)
+
+    def add_compute_node(self, node, inventories=None):
         # Build and add base node.
-        LOG.debug("node info: %s", node)
-        compute_node = self.build_compute_node(node)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("node info: %s", node)
+        compute_node = self.build_compute_node(node, inventories)
         self.model.add_node(compute_node)
 
         # NOTE(v-francoise): we can encapsulate capabilities of the node
@@ -365,13 +525,18 @@ class NovaModelBuilder(base.BaseModelBuilder):
         #                      (base_id, cpu_id), (base_id, net_id)],
         #                     label="contains")
 
-    def build_compute_node(self, node):
+        return compute_node
+
+    def build_compute_node(self, node, inventories=None):
         """Build a compute node from a Nova compute node
 
         :param node: A node hypervisor instance
         :type node: :py:class:`~novaclient.v2.hypervisors.Hypervisor`
+        :param inventories: placement inventories of the node, retrieved
+                            from placement when not provided
         """
-        inventories = self.placement_helper.get_inventories(node.id)
+        if inventories is None:
+            inventories = self.placement_helper.get_inventories(node.id)
         if inventories and orc.VCPU in inventories:
             vcpus = inventories[orc.VCPU]['total']
             vcpu_reserved = inventories[orc.VCPU]['reserved']
@@ -426,32 +591,26 @@ class NovaModelBuilder(base.BaseModelBuilder):
         return compute_node
 
     def add_instance_node(self, node, instances):
-        if instances is None:
+        """Add the instances hosted by a compute node to the model
+
+        :param node: compute node hosting the instances
+        :type node: :py:class:`~.ComputeNode`
+        :param instances: Nova servers hosted by the compute node
+        :type instances: list of :py:class:`~novaclient.v2.servers.Server`
+        """
+        if not instances:
             LOG.info("no instances on compute_node: %s", node)
             return
-        host = node.service["host"]
-        compute_node = self.model.get_node_by_uuid(node.id)
-        filters = {'host': host}
-        limit = len(instances) if len(instances) <= 1000 else -1
-        # Get all servers on this compute host.
-        # Note that the advantage of passing the limit parameter is
-        # that it can speed up the call time of novaclient. 1000 is
-        # the default maximum number of return servers provided by
-        # compute API. If we need to request more than 1000 servers,
-        # we can set limit=-1. For details, please see:
-        # https://bugs.launchpad.net/watcher/+bug/1834679
-        instances = self.call_retry(f=self.nova_helper.get_instance_list,
-                                    filters=filters, limit=limit)
+        deleted = element.InstanceState.DELETED.value
         for inst in instances:
             # skip deleted instance
-            if getattr(inst, "OS-EXT-STS:vm_state") == (
-                    element.InstanceState.DELETED.value):
+            if getattr(inst, VM_STATE_ATTR) == deleted:
                 continue
             # Add Node
             instance = self._build_instance_node(inst)
             self.model.add_instance(instance)
             # Connect the instance to its compute node
-            self.model.map_instance(instance, compute_node)
+            self.model.map_instance(instance, node)
 
     def _build_instance_node(self, instance):
         """Build an instance node
@@ -468,7 +627,7 @@ class NovaModelBuilder(base.BaseModelBuilder):
             "memory": flavor["ram"],
             "disk": flavor["disk"],
             "vcpus": flavor["vcpus"],
-            "state": getattr(instance, "OS-EXT-STS:vm_state"),
+            "state": getattr(instance, VM_STATE_ATTR),
             "metadata": instance.metadata,
             "project_id": instance.tenant_id,
             "locked": instance.locked}
@@ -486,17 +645,18 @@ class NovaModelBuilder(base.BaseModelBuilder):
 
         role_keys = ("host_aggregates", "availability_zones")
         for role in compute_scope:
-            role_key = list(role.keys())[0]
+            role_key, role_values = next(iter(role.items()))
             if role_key not in role_keys:
                 continue
-            role_values = list(role.values())[0]
             if role_key in model_keys:
                 for value in role_values:
                     if value not in self.model_scope[role_key]:
                         self.model_scope[role_key].append(value)
                         update_flag = True
             else:
-                self.model_scope[role_key] = role_values
+                # Copy the values so that merging further scopes does not
+                # modify the scope of the audit.
+                self.model_scope[role_key] = list(role_values)
                 update_flag = True
         return update_flag
 
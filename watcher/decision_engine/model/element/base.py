@@ -37,14 +37,28 @@ class Element(base.WatcherObject, base.WatcherObjectDictCompat,
     fields = {}
 
     def __init__(self, context=None, **kwargs):
-        for name, field in self.fields.items():
-            # The idea here is to force the initialization of unspecified
-            # fields that have a default value
-            if (name not in kwargs and not field.nullable and
-                    field.default != wfields.UnspecifiedDefault):
-                kwargs[name] = field.default
+        # The idea here is to force the initialization of unspecified
+        # fields that have a default value
+        for name, default in self._get_field_defaults().items():
+            kwargs.setdefault(name, default)
         super(Element, self).__init__(context, **kwargs)
 
+    @classmethod
+    def _get_field_defaults(cls):
+        """Default values of the non nullable fields, computed once per class
+
+        Elements are created for every node and instance of the cluster, so
+        the fields are not inspected again for each of them.
+        """
+        defaults = cls.__dict__.get('_field_defaults')
+        if defaults is None:
+            defaults = {name: field.default
+                        for name, field in cls.fields.items()
+                        if (not field.nullable and
+                            field.default != wfields.UnspecifiedDefault)}
+            cls._field_defaults = defaults
+        return defaults
+
     @abc.abstractmethod
     def accept(self, visitor):
         raise NotImplementedError()
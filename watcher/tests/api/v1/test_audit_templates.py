@@ -25,6 +25,7 @@ from wsme import types as wtypes
 from watcher.api.controllers.v1 import audit_template as api_audit_template
 from watcher.common import exception
 from watcher.common import utils
+from watcher.decision_engine.loading import default as default_loading
 from watcher import objects
 from watcher.tests.api import base as api_base
 from watcher.tests.api import utils as api_utils
@@ -530,6 +531,16 @@ class TestPatch(FunctionalTestWithSetup):
 
 class TestPost(FunctionalTestWithSetup):
 
+    def setUp(self):
+        super(TestPost, self).setUp()
+        # The scope validator is cached on the class, reset it so that it is
+        # built by this test and does not leak into the other ones.
+        p_validator = mock.patch.object(
+            api_audit_template.AuditTemplatePostType, '_scope_validator',
+            None)
+        p_validator.start()
+        self.addCleanup(p_validator.stop)
+
     @mock.patch.object(timeutils, 'utcnow')
     def test_create_audit_template(self, mock_utcnow):
         audit_template_dict = post_get_test_audit_template(
@@ -618,6 +629,29 @@ class TestPost(FunctionalTestWithSetup):
         self.assertEqual(HTTPStatus.INTERNAL_SERVER_ERROR,
                          response.status_int)
 
+    def test_create_audit_template_builds_scope_schema_once(self):
+        audit_template_post_type = api_audit_template.AuditTemplatePostType
+        collector_loader = default_loading.ClusterDataModelCollectorLoader
+        scope = [{'compute': [{'host_aggregates': [{'id': '*'}]}]}]
+
+        with mock.patch.object(
+            collector_loader, 'list_available', autospec=True,
+            side_effect=collector_loader.list_available
+        ) as m_list_available, mock.patch.object(
+            audit_template_post_type, '_build_schema',
+            side_effect=audit_template_post_type._build_schema
+        ) as m_build_schema:
+            for name in ('template_1', 'template_2'):
+                audit_template_dict = post_get_test_audit_template(
+                    name=name, goal=self.fake_goal1.uuid,
+                    strategy=self.fake_strategy1.uuid, scope=scope)
+                response = self.post_json('/audit_templates',
+                                          audit_template_dict)
+                self.assertEqual(HTTPStatus.CREATED, response.status_int)
+
+        m_list_available.assert_called_once_with(mock.ANY)
+        m_build_schema.assert_called_once_with()
+
     def test_create_audit_template_does_autogenerate_id(self):
         audit_template_dict = post_get_test_audit_template(
             goal=self.fake_goal1.uuid, strategy=None)
@@ -27,6 +27,7 @@ import testscenarios
 
 from watcher.common import context as watcher_context
 from watcher.common import service
+from watcher.decision_engine.model.collector import nova as nova_collector
 from watcher.objects import base as objects_base
 from watcher.tests import conf_fixture
 from watcher.tests import policy_fixture
@@ -110,6 +111,9 @@ class TestCase(BaseTestCase):
 
     def _reset_singletons(self):
         service.Singleton._instances.clear()
+        # The nova listings are shared by all the model builders, do not let
+        # the mocked listings of a test leak into the other ones.
+        nova_collector.NovaModelBuilder._clear_listing_cache()
 
         def reset_pecan():
             pecan.set_config({}, overwrite=True)
@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+from keystoneauth1.exceptions import http as ks_exceptions
+
+from watcher.common import clients
+from watcher.common import exception
+from watcher.common import keystone_helper
+from watcher.tests import base
+
+
+@mock.patch.object(clients.OpenStackClients, 'keystone')
+class TestKeystoneHelper(base.TestCase):
+
+    def test_get_role_by_id(self, mock_keystone):
+        role = mock.Mock(id='role_id')
+        mock_keystone.return_value.roles.get.return_value = role
+        helper = keystone_helper.KeystoneHelper()
+
+        self.assertEqual(role, helper.get_role('role_id'))
+        self.assertEqual(role, helper.get_role('role_id'))
+        mock_keystone.return_value.roles.get.assert_called_once_with(
+            'role_id')
+
+    def test_get_role_by_name(self, mock_keystone):
+        role = mock.Mock(id='role_id')
+        roles = mock_keystone.return_value.roles
+        roles.get.side_effect = ks_exceptions.NotFound
+        roles.list.return_value = [role]
+        helper = keystone_helper.KeystoneHelper()
+
+        self.assertEqual(role, helper.get_role('admin'))
+        self.assertEqual(role, helper.get_role('admin'))
+        self.assertEqual(role, helper.get_role('role_id'))
+        roles.get.assert_called_once_with('admin')
+        roles.list.assert_called_once_with(name='admin')
+
+    def test_get_project_not_found(self, mock_keystone):
+        projects = mock_keystone.return_value.projects
+        projects.get.side_effect = ks_exceptions.NotFound
+        projects.list.return_value = []
+        helper = keystone_helper.KeystoneHelper()
+
+        exc = self.assertRaises(exception.Invalid, helper.get_project, 'foo')
+        self.assertEqual('Project not Found: foo', str(exc))
+
+    def test_get_domain_ambiguous(self, mock_keystone):
+        domains = mock_keystone.return_value.domains
+        domains.get.side_effect = ks_exceptions.NotFound
+        domains.list.return_value = [mock.Mock(), mock.Mock()]
+        helper = keystone_helper.KeystoneHelper()
+
+        exc = self.assertRaises(exception.Invalid, helper.get_domain, 'foo')
+        self.assertEqual('Domain name seems ambiguous: foo', str(exc))
+
+    def test_create_user_resolves_role_once(self, mock_keystone):
+        keystone = mock_keystone.return_value
+        keystone.roles.get.return_value = mock.Mock(id='role_id')
+        helper = keystone_helper.KeystoneHelper()
+        user = {'name': 'foo', 'password': 'bar', 'project': 'project_id',
+                'domain': 'domain_id', 'roles': ['admin', 'admin']}
+
+        helper.create_user(user)
+
+        keystone.roles.get.assert_called_once_with('admin')
+        self.assertEqual(2, keystone.roles.grant.call_count)
+
+    def test_create_user(self, mock_keystone):
+        keystone = mock_keystone.return_value
+        project = mock.Mock(id='project_id')
+        domain = mock.Mock(id='domain_id')
+        keystone.projects.get.return_value = project
+        keystone.domains.get.return_value = domain
+        keystone.roles.get.side_effect = lambda name: mock.Mock(id=name)
+        keystone.users.create.return_value = mock.Mock(id='user_id')
+        helper = keystone_helper.KeystoneHelper()
+        user = {'name': 'foo', 'password': 'bar', 'project': 'project_id',
+                'domain': 'domain_id', 'roles': ['admin', 'member']}
+
+        self.assertEqual(keystone.users.create.return_value,
+                         helper.create_user(user))
+
+        keystone.users.create.assert_called_once_with(
+            'foo', password='bar', domain=domain, project=project)
+        keystone.roles.grant.assert_has_calls(
+            [mock.call('admin', user='user_id', project='project_id'),
+             mock.call('member', user='user_id', project='project_id')],
+            any_order=True)
+
+    def test_create_user_role_not_found(self, mock_keystone):
+        keystone = mock_keystone.return_value
+        keystone.roles.get.side_effect = ks_exceptions.NotFound
+        keystone.roles.list.return_value = []
+        helper = keystone_helper.KeystoneHelper()
+        user = {'name': 'foo', 'password': 'bar', 'project': 'project_id',
+                'domain': 'domain_id', 'roles': ['foo']}
+
+        self.assertRaises(exception.Invalid, helper.create_user, user)
+        keystone.users.create.assert_not_called()
+
+    def test_delete_user_clears_cache(self, mock_keystone):
+        users = mock_keystone.return_value.users
+        users.get.return_value = mock.Mock(id='user_id')
+        helper = keystone_helper.KeystoneHelper()
+
+        helper.get_user('user_id')
+        helper.delete_user('user_id')
+        helper.get_user('user_id')
+
+        self.assertEqual(2, users.get.call_count)
+        users.delete.assert_called_once_with(users.get.return_value)
@@ -703,3 +703,56 @@ class TestNovaHelper(base.TestCase):
         self.assertEqual(1, len(compute_nodes))
         self.assertEqual(hypervisor1_name,
                          compute_nodes[0].hypervisor_hostname)
+
+    def test_get_compute_node_detail_map(
+            self, mock_glance, mock_cinder, mock_neutron, mock_nova):
+        nova_util = nova_helper.NovaHelper()
+        hypervisor1_id = utils.generate_uuid()
+        hypervisor1 = self.fake_hypervisor(
+            hypervisor1_id, "fake_hypervisor_1", hypervisor_type="QEMU")
+
+        hypervisor2_id = utils.generate_uuid()
+        hypervisor2 = self.fake_hypervisor(
+            hypervisor2_id, "fake_ironic", hypervisor_type="ironic")
+
+        nova_util.nova.hypervisors.list.return_value = [hypervisor1,
+                                                        hypervisor2]
+
+        compute_nodes = nova_util.get_compute_node_detail_map()
+
+        nova_util.nova.hypervisors.list.assert_called_once_with(
+            detailed=True, marker=None, limit=1000)
+        self.assertEqual({hypervisor1_id: hypervisor1,
+                          hypervisor2_id: hypervisor2}, compute_nodes)
+
+    def test_get_compute_node_detail_map_pages(
+            self, mock_glance, mock_cinder, mock_neutron, mock_nova):
+        nova_util = nova_helper.NovaHelper()
+        hypervisors = [
+            self.fake_hypervisor(utils.generate_uuid(),
+                                 "fake_hypervisor_%d" % i)
+            for i in range(5)]
+
+        nova_util.nova.hypervisors.list.side_effect = [
+            hypervisors[:2], hypervisors[2:4], hypervisors[4:]]
+
+        compute_nodes = nova_util.get_compute_node_detail_map(limit=2)
+
+        nova_util.nova.hypervisors.list.assert_has_calls([
+            mock.call(detailed=True, marker=None, limit=2),
+            mock.call(detailed=True, marker=hypervisors[1].id, limit=2),
+            mock.call(detailed=True, marker=hypervisors[3].id, limit=2)])
+        self.assertEqual(3, nova_util.nova.hypervisors.list.call_count)
+        self.assertEqual({node.id: node for node in hypervisors},
+                         compute_nodes)
+
+        # a last full page is followed by an empty one
+        nova_util.nova.hypervisors.list.reset_mock()
+        nova_util.nova.hypervisors.list.side_effect = [
+            hypervisors[:2], hypervisors[2:4], []]
+
+        compute_nodes = nova_util.get_compute_node_detail_map(limit=2)
+
+        self.assertEqual(3, nova_util.nova.hypervisors.list.call_count)
+        self.assertEqual({node.id: node for node in hypervisors[:4]},
+                         compute_nodes)
@@ -83,13 +83,6 @@ class TestNovaClusterDataModelCollector(base.TestCase):
             state='TEST_STATE',
             status='TEST_STATUS',
         )
-        minimal_node_with_servers = dict(
-            servers=[
-                {'name': 'fake_instance',
-                 'uuid': 'ef500f7e-dac8-470f-960c-169486fce71b'}
-            ],
-            **minimal_node
-        )
         fake_compute_node = mock.Mock(
             service={'id': 123, 'host': 'test_hostname',
                      'disabled_reason': ''},
@@ -103,17 +96,6 @@ class TestNovaClusterDataModelCollector(base.TestCase):
             servers=None,  # Don't let the mock return a value for servers.
             **minimal_node
         )
-        fake_detailed_node = mock.Mock(
-            service={'id': 123, 'host': 'test_hostname',
-                     'disabled_reason': ''},
-            memory_mb=333,
-            memory_mb_used=100,
-            free_disk_gb=222,
-            local_gb=111,
-            local_gb_used=10,
-            vcpus=4,
-            vcpus_used=0,
-            **minimal_node_with_servers)
         fake_instance = mock.Mock(
             id='ef500f7e-dac8-470f-960c-169486fce71b',
             name='fake_instance',
@@ -122,13 +104,12 @@ class TestNovaClusterDataModelCollector(base.TestCase):
             tenant_id='ff560f7e-dbc8-771f-960c-164482fce21b',
         )
         setattr(fake_instance, 'OS-EXT-STS:vm_state', 'VM_STATE')
+        setattr(fake_instance, 'OS-EXT-SRV-ATTR:host', 'test_hostname')
         setattr(fake_instance, 'name', 'fake_instance')
-        # Returns the hypervisors with details (service) but no servers.
-        m_nova_helper.get_compute_node_list.return_value = [fake_compute_node]
-        # Returns the hypervisor with servers and details (service).
-        m_nova_helper.get_compute_node_by_name.return_value = [
-            fake_detailed_node]
-        # Returns the hypervisor with details (service) but no servers.
+        # Returns the hypervisors with details (service) by id.
+        m_nova_helper.get_compute_node_detail_map.return_value = {
+            fake_compute_node.id: fake_compute_node}
+        # Returns the servers of all the hosts.
         m_nova_helper.get_instance_list.return_value = [fake_instance]
 
         m_config = mock.Mock()
@@ -161,10 +142,19 @@ class TestNovaClusterDataModelCollector(base.TestCase):
         vcpus_total = (node.vcpus-node.vcpu_reserved)*node.vcpu_ratio
         self.assertEqual(node.vcpu_capacity, vcpus_total)
 
-        m_nova_helper.get_compute_node_by_name.assert_called_once_with(
-            minimal_node['hypervisor_hostname'], servers=True, detailed=True)
-        m_nova_helper.get_instance_list.assert_called_once_with(
-            filters={'host': fake_compute_node.service['host']}, limit=1)
+        # the listed hypervisors are not searched again
+        m_nova_helper.get_compute_node_detail_map.assert_called_once_with()
+        m_nova_helper.get_compute_node_by_name.assert_not_called()
+        m_nova_helper.get_instance_list.assert_called_once_with()
+
+    def test_notification_endpoints(self):
+        nova_cdmc = nova.NovaClusterDataModelCollector(
+            config=mock.Mock(), osc=mock.Mock())
+
+        endpoints = nova_cdmc.notification_endpoints
+
+        self.assertEqual(1, len(endpoints))
+        self.assertIs(endpoints, nova_cdmc.notification_endpoints)
 
 
 class TestNovaModelBuilder(base.TestCase):
@@ -174,7 +164,6 @@ class TestNovaModelBuilder(base.TestCase):
         model_builder = nova.NovaModelBuilder(osc=mock.MagicMock())
         model_builder.model = mock.MagicMock()
         mock_node = mock.MagicMock()
-        mock_host = mock_node.service["host"]
         inst1 = mock.MagicMock(
             id='ef500f7e-dac8-470f-960c-169486fce711',
             tenant_id='ff560f7e-dbc8-771f-960c-164482fce21b')
@@ -186,22 +175,43 @@ class TestNovaModelBuilder(base.TestCase):
         setattr(inst2, 'OS-EXT-STS:vm_state', 'active')
         setattr(inst2, 'name', 'instance2')
         mock_instances = [inst1, inst2]
-        model_builder.nova_helper.get_instance_list.return_value = (
-            mock_instances)
         model_builder.add_instance_node(mock_node, mock_instances)
-        # verify that when len(instances) <= 1000, limit == len(instance).
-        model_builder.nova_helper.get_instance_list.assert_called_once_with(
-            filters={'host': mock_host}, limit=2)
+        # the instances are not retrieved again from nova
+        model_builder.nova_helper.get_instance_list.assert_not_called()
         fake_instance = model_builder._build_instance_node(inst2)
         model_builder.model.add_instance.assert_called_once_with(
             fake_instance)
+        model_builder.model.map_instance.assert_called_once_with(
+            fake_instance, mock_node)
 
-        # verify that when len(instances) > 1000, limit == -1.
-        mock_instance = mock.Mock()
-        mock_instances = [mock_instance] * 1001
-        model_builder.add_instance_node(mock_node, mock_instances)
-        model_builder.nova_helper.get_instance_list.assert_called_with(
-            filters={'host': mock_host}, limit=-1)
+        # no instance is added to a compute node without instances
+        model_builder.add_instance_node(mock_node, None)
+        model_builder.model.add_instance.assert_called_once_with(
+            fake_instance)
+
+    @mock.patch.object(nova_helper, 'NovaHelper', mock.MagicMock())
+    def test_get_instances(self):
+        model_builder = nova.NovaModelBuilder(osc=mock.MagicMock())
+        get_instance_list = model_builder.nova_helper.get_instance_list
+        node = mock.Mock(running_vms=3, service={'host': 'hostone'})
+
+        self.assertEqual(get_instance_list.return_value,
+                         model_builder._get_instances(node))
+        get_instance_list.assert_called_once_with(
+            filters={'host': 'hostone'}, limit=3)
+
+        # more servers than a single page can hold, list all of them
+        get_instance_list.reset_mock()
+        node.running_vms = 1001
+        model_builder._get_instances(node)
+        get_instance_list.assert_called_once_with(
+            filters={'host': 'hostone'}, limit=-1)
+
+        # no servers are listed for an empty compute node
+        get_instance_list.reset_mock()
+        node.running_vms = 0
+        self.assertEqual([], model_builder._get_instances(node))
+        get_instance_list.assert_not_called()
 
     def test_check_model(self):
         """Initialize collector ModelBuilder and test check model"""
@@ -273,6 +283,33 @@ class TestNovaModelBuilder(base.TestCase):
 
         self.assertEqual(reference, t_nova_cluster.model_scope)
 
+    def test_merge_compute_scope_does_not_modify_scope(self):
+        m_scope_one = [{"host_aggregates": [{"id": 5}]}]
+        m_scope_two = [{"host_aggregates": [{"id": 4}]}]
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        t_nova_cluster._merge_compute_scope(m_scope_one)
+        t_nova_cluster._merge_compute_scope(m_scope_two)
+
+        self.assertEqual([{"host_aggregates": [{"id": 5}]}], m_scope_one)
+        self.assertEqual({'host_aggregates': [{'id': 5}, {'id': 4}]},
+                         t_nova_cluster.model_scope)
+
+    @mock.patch.object(nova.NovaModelBuilder, '_add_physical_layer')
+    def test_execute_same_scope(self, m_add_physical_layer):
+        """The model is only built once for an unchanged scope"""
+
+        m_scope = [{"compute": [
+            {"host_aggregates": [{"id": 5}]},
+            {"availability_zones": [{"name": "av_a"}]}
+        ]}]
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        model = t_nova_cluster.execute(m_scope)
+
+        self.assertIs(model, t_nova_cluster.execute(m_scope))
+        m_add_physical_layer.assert_called_once_with()
+
     @mock.patch.object(nova_helper, 'NovaHelper')
     def test_collect_aggregates(self, m_nova):
         """"""
@@ -291,6 +328,50 @@ class TestNovaModelBuilder(base.TestCase):
 
         self.assertEqual(set(['hostone', 'hosttwo']), result)
 
+    @mock.patch.object(nova_helper, 'NovaHelper')
+    def test_collect_aggregates_wildcard(self, m_nova):
+        """Test collect_aggregates includes every aggregate with '*'"""
+
+        m_nova.return_value.get_aggregate_list.return_value = \
+            [mock.Mock(id=1, name='example', hosts=['hostone']),
+             mock.Mock(id=5, name='example', hosts=['hosttwo'])]
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        result = set()
+        t_nova_cluster._collect_aggregates([{'id': '*'}], result)
+
+        self.assertEqual(set(['hostone', 'hosttwo']), result)
+
+    @mock.patch.object(nova_helper, 'NovaHelper')
+    def test_collect_aggregates_cached(self, m_nova):
+        """Test the aggregate list is reused by the following builders"""
+
+        m_nova.return_value.get_aggregate_list.return_value = \
+            [mock.Mock(id=5, name='example', hosts=['hostone'])]
+
+        for _ in range(2):
+            result = set()
+            nova.NovaModelBuilder(mock.Mock())._collect_aggregates(
+                [{'id': 5}], result)
+            self.assertEqual(set(['hostone']), result)
+
+        m_nova.return_value.get_aggregate_list.assert_called_once_with()
+
+    @mock.patch.object(nova_helper, 'NovaHelper')
+    def test_collect_aggregates_cache_expired(self, m_nova):
+        """Test the aggregate list is retrieved again once expired"""
+
+        self.config(compute_metadata_cache_ttl=0, group='collector')
+        m_nova.return_value.get_aggregate_list.return_value = \
+            [mock.Mock(id=5, name='example', hosts=['hostone'])]
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        for _ in range(2):
+            t_nova_cluster._collect_aggregates([{'id': 5}], set())
+
+        self.assertEqual(
+            2, m_nova.return_value.get_aggregate_list.call_count)
+
     @mock.patch.object(nova_helper, 'NovaHelper')
     def test_collect_aggregates_none(self, m_nova):
         """Test collect_aggregates with host_aggregates None"""
@@ -318,6 +399,20 @@ class TestNovaModelBuilder(base.TestCase):
 
         self.assertEqual(set(['hostone']), result)
 
+    @mock.patch.object(nova_helper, 'NovaHelper')
+    def test_collect_zones_wildcard(self, m_nova):
+        """Test collect_zones includes every zone with '*'"""
+
+        m_nova.return_value.get_service_list.return_value = \
+            [mock.Mock(zone='av_b', host='hosttwo'),
+             mock.Mock(zone='av_a', host='hostone')]
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        result = set()
+        t_nova_cluster._collect_zones([{'name': '*'}], result)
+
+        self.assertEqual(set(['hostone', 'hosttwo']), result)
+
     @mock.patch.object(nova_helper, 'NovaHelper')
     def test_collect_zones_none(self, m_nova):
         """Test collect_zones with availability_zones None"""
@@ -338,10 +433,11 @@ class TestNovaModelBuilder(base.TestCase):
         duplicates. The scope is setup so that only hostone and hosttwo should
         remain.
 
-        There will be 2 simulated compute nodes and 2 associated instances.
-        These will be returned by their matching calls in nova helper. The
-        calls to get_compute_node_by_name and get_instance_list are asserted
-        as to verify the correct operation of add_physical_layer.
+        There will be 3 simulated compute nodes of which 2 are in the scope
+        and 2 associated instances. These will be returned by their matching
+        calls in nova helper. The calls to get_compute_node_detail_map and
+        get_instance_list are asserted as to verify the correct operation of
+        add_physical_layer.
         """
 
         mock_placement = mock.Mock(name="placement_helper")
@@ -370,6 +466,7 @@ class TestNovaModelBuilder(base.TestCase):
             local_gb_used=10,
             vcpus=4,
             vcpus_used=0,
+            running_vms=1,
             servers=[
                 {'name': 'fake_instance',
                  'uuid': 'ef500f7e-dac8-470f-960c-169486fce71b'}
@@ -391,6 +488,7 @@ class TestNovaModelBuilder(base.TestCase):
             local_gb_used=10,
             vcpus=4,
             vcpus_used=0,
+            running_vms=1,
             servers=[
                 {'name': 'fake_instance2',
                  'uuid': 'ef500f7e-dac8-47f0-960c-169486fce71b'}
@@ -399,12 +497,20 @@ class TestNovaModelBuilder(base.TestCase):
                      'disabled_reason': ''},
         )
 
-        m_nova.return_value.get_compute_node_by_name.side_effect = [
-            [compute_node_one], [compute_node_two]
-        ]
+        compute_node_three = mock.Mock(
+            id='35be8a5b-eb8b-48f1-8d6d-5b5a1d6c4f8f',
+            hypervisor_hostname='hostthree',
+            hypervisor_type='QEMU',
+            service={'id': 456, 'host': 'hostthree',
+                     'disabled_reason': ''},
+        )
+
+        m_nova.return_value.get_compute_node_detail_map.return_value = {
+            node.id: node for node in (
+                compute_node_one, compute_node_two, compute_node_three)}
 
         fake_instance_one = mock.Mock(
-            id='796fee99-65dd-4262-aa-fd2a1143faa6',
+            id='ef500f7e-dac8-470f-960c-169486fce71b',
             name='fake_instance',
             flavor={'ram': 333, 'disk': 222, 'vcpus': 4, 'id': 1},
             metadata={'hi': 'hello'},
@@ -417,9 +523,20 @@ class TestNovaModelBuilder(base.TestCase):
             metadata={'hi': 'hello'},
             tenant_id='756fef99-65dd-4262-aa-fd2a1143faa6',
         )
-        m_nova.return_value.get_instance_list.side_effect = [
-            [fake_instance_one], [fake_instance_two]
-        ]
+        fake_instance_one.name = 'fake_instance'
+        fake_instance_two.name = 'fake_instance2'
+        setattr(fake_instance_one, 'OS-EXT-SRV-ATTR:host', 'hostone')
+        setattr(fake_instance_two, 'OS-EXT-SRV-ATTR:host', 'hosttwo')
+        fake_instance_three = mock.Mock(id='out_of_scope')
+        setattr(fake_instance_three, 'OS-EXT-SRV-ATTR:host', 'hostthree')
+        for fake_instance in (fake_instance_one, fake_instance_two):
+            setattr(fake_instance, 'OS-EXT-STS:vm_state', 'active')
+            fake_instance.locked = False
+        instances_by_host = {'hostone': [fake_instance_one],
+                             'hosttwo': [fake_instance_two],
+                             'hostthree': [fake_instance_three]}
+        m_nova.return_value.get_instance_list.side_effect = (
+            lambda filters, limit: instances_by_host[filters['host']])
 
         m_scope = [{"compute": [
             {"host_aggregates": [{"id": 5}]},
@@ -427,20 +544,101 @@ class TestNovaModelBuilder(base.TestCase):
         ]}]
 
         t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
-        t_nova_cluster.execute(m_scope)
-        m_nova.return_value.get_compute_node_by_name.assert_any_call(
-            'hostone', servers=True, detailed=True)
-        m_nova.return_value.get_compute_node_by_name.assert_any_call(
-            'hosttwo', servers=True, detailed=True)
+        model = t_nova_cluster.execute(m_scope)
         self.assertEqual(
-            m_nova.return_value.get_compute_node_by_name.call_count, 2)
+            {compute_node_one.id, compute_node_two.id},
+            set(model.get_all_compute_nodes()))
+        self.assertEqual(2, len(model.get_all_instances()))
+        m_nova.return_value.get_compute_node_detail_map.\
+            assert_called_once_with()
+        m_nova.return_value.get_compute_node_by_name.assert_not_called()
+
+        m_nova.return_value.get_instance_list.assert_has_calls(
+            [mock.call(filters={'host': 'hostone'}, limit=1),
+             mock.call(filters={'host': 'hosttwo'}, limit=1)],
+            any_order=True)
+        self.assertEqual(
+            2, m_nova.return_value.get_instance_list.call_count)
+
+        mock_placement.get_inventories.assert_any_call(compute_node_one.id)
+        mock_placement.get_inventories.assert_any_call(compute_node_two.id)
+        self.assertEqual(mock_placement.get_inventories.call_count, 2)
+
+    @mock.patch.object(nova.NovaModelBuilder, '_get_instances')
+    @mock.patch.object(placement_helper, 'PlacementHelper')
+    @mock.patch.object(nova_helper, 'NovaHelper')
+    def test_add_physical_layer_instances_error(self, m_nova, m_placement,
+                                                m_get_instances):
+        """A failed instance listing only leaves its compute node empty"""
+
+        m_placement.return_value.get_inventories.return_value = dict()
+        m_nova.return_value.get_aggregate_list.return_value = \
+            [mock.Mock(id=5, name='example', hosts=['hostone', 'hosttwo'])]
+
+        compute_nodes = [
+            mock.Mock(id=node_id, hypervisor_type='QEMU', state='up',
+                      status='enabled', memory_mb=333, local_gb=111,
+                      vcpus=4, service={'id': 123, 'host': host,
+                                        'disabled_reason': ''})
+            for node_id, host in (
+                ('796fee99-65dd-4262-aa-fd2a1143faa6', 'hostone'),
+                ('756fef99-65dd-4262-aa-fd2a1143faa6', 'hosttwo'))]
+        m_nova.return_value.get_compute_node_detail_map.return_value = {
+            node.id: node for node in compute_nodes}
+
+        fake_instance = mock.Mock(
+            id='ef500f7e-dac8-470f-960c-169486fce71b',
+            flavor={'ram': 333, 'disk': 222, 'vcpus': 4, 'id': 1},
+            metadata={'hi': 'hello'},
+            tenant_id='ff560f7e-dbc8-771f-960c-164482fce21b',
+            locked=False,
+        )
+        fake_instance.name = 'fake_instance'
+        setattr(fake_instance, 'OS-EXT-STS:vm_state', 'active')
+
+        def get_instances(node_info):
+            if node_info.service['host'] == 'hosttwo':
+                raise Exception()
+            return [fake_instance]
+        m_get_instances.side_effect = get_instances
+
+        m_scope = [{"compute": [{"host_aggregates": [{"id": 5}]}]}]
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        model = t_nova_cluster.execute(m_scope)
 
-        m_nova.return_value.get_instance_list.assert_any_call(
-            filters={'host': 'hostone'}, limit=1)
-        m_nova.return_value.get_instance_list.assert_any_call(
-            filters={'host': 'hosttwo'}, limit=1)
         self.assertEqual(
-            m_nova.return_value.get_instance_list.call_count, 2)
+            {node.id for node in compute_nodes},
+            set(model.get_all_compute_nodes()))
+        self.assertEqual([fake_instance.id], list(model.get_all_instances()))
+        self.assertEqual(
+            compute_nodes[0].id,
+            model.get_node_by_instance_uuid(fake_instance.id).uuid)
+
+    @mock.patch.object(placement_helper, 'PlacementHelper')
+    @mock.patch.object(nova_helper, 'NovaHelper')
+    def test_add_physical_layer_instance_list_error(self, m_nova,
+                                                    m_placement):
+        """A failed instance listing does not abort the model build"""
+
+        self.config(api_call_retries=1, api_query_timeout=0,
+                    group='collector')
+        m_placement.return_value.get_inventories.return_value = dict()
+        compute_node = mock.Mock(
+            id='796fee99-65dd-4262-aa-fd2a1143faa6', hypervisor_type='QEMU',
+            state='up', status='enabled', memory_mb=333, local_gb=111,
+            vcpus=4,
+            service={'id': 123, 'host': 'hostone', 'disabled_reason': ''})
+        m_nova.return_value.get_compute_node_detail_map.return_value = {
+            compute_node.id: compute_node}
+        m_nova.return_value.get_instance_list.side_effect = Exception()
+
+        t_nova_cluster = nova.NovaModelBuilder(mock.Mock())
+        model = t_nova_cluster.execute([])
+
+        self.assertEqual([compute_node.id],
+                         list(model.get_all_compute_nodes()))
+        self.assertEqual({}, model.get_all_instances())
 
     @mock.patch.object(placement_helper, 'PlacementHelper')
     @mock.patch.object(nova_helper, 'NovaHelper')
@@ -472,6 +670,7 @@ class TestNovaModelBuilder(base.TestCase):
             local_gb_used=10,
             vcpus=4,
             vcpus_used=0,
+            running_vms=0,
             servers=[
                 {'name': 'fake_instance',
                  'uuid': 'ef500f7e-dac8-470f-960c-169486fce71b'}
@@ -486,10 +685,12 @@ class TestNovaModelBuilder(base.TestCase):
             hypervisor_type='ironic',
             state='TEST_STATE',
             status='TEST_STATUS',
+            service={'id': 456, 'host': 'hosttwo',
+                     'disabled_reason': ''},
         )
 
-        m_nova.return_value.get_compute_node_by_name.side_effect = [
-            [compute_node], [baremetal_node]]
+        m_nova.return_value.get_compute_node_detail_map.return_value = {
+            compute_node.id: compute_node, baremetal_node.id: baremetal_node}
 
         m_scope = [{"compute": [
             {"host_aggregates": [{"id": 5}]},
@@ -501,9 +702,7 @@ class TestNovaModelBuilder(base.TestCase):
 
         compute_nodes = model.get_all_compute_nodes()
         self.assertEqual(1, len(compute_nodes))
-        m_nova.return_value.get_compute_node_by_name.assert_any_call(
-            'hostone', servers=True, detailed=True)
-        m_nova.return_value.get_compute_node_by_name.assert_any_call(
-            'hosttwo', servers=True, detailed=True)
-        self.assertEqual(
-            m_nova.return_value.get_compute_node_by_name.call_count, 2)
+        m_nova.return_value.get_compute_node_detail_map.\
+            assert_called_once_with()
+        m_nova.return_value.get_compute_node_by_name.assert_not_called()
+        m_nova.return_value.get_instance_list.assert_not_called()
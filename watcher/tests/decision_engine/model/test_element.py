@@ -17,6 +17,7 @@
 # limitations under the License.
 
 from watcher.decision_engine.model import element
+from watcher.objects import fields as wfields
 from watcher.tests import base
 
 
@@ -66,6 +67,15 @@ class TestElement(base.TestCase):
         el = self.cls(**self.data)
         el.as_xml_element()
 
+    def test_field_defaults(self):
+        el = self.cls(**self.data)
+        for name, field in el.fields.items():
+            if name in self.data:
+                self.assertEqual(self.data[name], el[name])
+            elif (not field.nullable and
+                    field.default != wfields.UnspecifiedDefault):
+                self.assertEqual(field.default, el[name])
+
 
 class TestStorageElement(base.TestCase):
 